@@ -12,9 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License
 
-from typing import Any, Dict, List, Set, Union, TYPE_CHECKING
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Union, TYPE_CHECKING
 from typing import cast as typecast
 
+import sys
+
+from functools import lru_cache
+
 from ..common import EnvoyRoute
 from ...cache import Cacheable
 from ...ir.irhttpmappinggroup import IRHTTPMappingGroup
@@ -26,74 +30,163 @@ if TYPE_CHECKING:
     from . import V2Config
 
 
+# CPython automatically interns string literals that look like identifiers,
+# which covers nearly every key in the route dicts we build below -- interned
+# keys get hashed once and compared by identity when the dicts are re-probed
+# during serialization. 'envoy.ext_authz' has a dot in it, so it doesn't
+# qualify; intern it explicitly and use the constant.
+_FILTER_EXT_AUTHZ = sys.intern('envoy.ext_authz')
+
+# A host-redirect-only group has no mappings at all, but V2Route's constructor
+# still wants something dict-shaped to poke at. Casting an empty dict to an
+# IRBaseMapping may look weird, but in fact IRBaseMapping is (ultimately) a
+# subclass of dict, so it's the cleanest way to get a completely empty one.
+# Share a single sentinel rather than allocating a fresh dict per group;
+# nothing ever writes to it.
+#
+# (We could also have written V2Route to allow the mapping to be Optional, but
+# that makes a lot of its constructor much uglier.)
+_EMPTY_MAPPING = typecast(IRBaseMapping, {})
+
+# Every runtime_fraction we emit uses the HUNDRED denominator, and a 100%
+# numerator is far and away the most common case, so share one prebuilt
+# default_value for it instead of allocating an identical dict per route.
+# Nobody mutates these after construction; they only get serialized.
+_DENOM_HUNDRED = 'HUNDRED'
+_WEIGHT_100_DEFAULT = { 'numerator': 100, 'denominator': _DENOM_HUNDRED }
+
+
+@lru_cache(maxsize=4096)
+def _regex_matcher(regex: str, re_type: str, key: str, safe_key: Optional[str], max_size: int) -> Dict[str, Any]:
+    # 'safe' is the default. You must explicitly say "unsafe" to get the unsafe
+    # regex matcher.
+    if re_type != 'unsafe':
+        if not safe_key:
+            safe_key = "safe_" + key
+
+        return {
+            safe_key: {
+                "google_re2": {
+                    "max_program_size": max_size
+                },
+                "regex": regex
+            }
+        }
+    else:
+        return {
+            key: regex
+        }
+
+
 def regex_matcher(config: 'V2Config', regex: str, key="regex", safe_key=None, re_type=None) -> Dict[str, Any]:
-        # If re_type is specified explicitly, do not query its value from config
+        # If re_type is specified explicitly, do not query its value from config.
+        # V2Route.generate hoists the module lookups onto the config so we don't
+        # redo them for every matcher; fall back to the module for callers that
+        # arrive outside of generation.
         if re_type is None:
-            re_type = config.ir.ambassador_module.get('regex_type', 'safe').lower()
+            re_type = getattr(config, '_regex_type', None)
+
+            if re_type is None:
+                re_type = config.ir.ambassador_module.get('regex_type', 'safe').lower()
 
         config.ir.logger.debug(f"re_type {re_type}")
 
-        # 'safe' is the default. You must explicitly say "unsafe" to get the unsafe
-        # regex matcher.
         if re_type != 'unsafe':
-            max_size = int(config.ir.ambassador_module.get('regex_max_size', 200))
+            max_size = getattr(config, '_regex_max_size', None)
 
-            if not safe_key:
-                safe_key = "safe_" + key
-
-            return {
-                safe_key: {
-                    "google_re2": {
-                        "max_program_size": max_size
-                    },
-                    "regex": regex
-                }
-            }
+            if max_size is None:
+                max_size = int(config.ir.ambassador_module.get('regex_max_size', 200))
         else:
-            return {
-                key: regex
-            }
+            max_size = 0
 
+        # The matcher dict depends only on its inputs, and in a config with many
+        # regex-typed mappings we'll build the same dict over and over. Share a
+        # single memoized instance instead; callers treat it as frozen.
+        return _regex_matcher(regex, re_type, key, safe_key, max_size)
 
-def hostglob_matches(glob: str, value: str) -> bool:
+
+@lru_cache(maxsize=256)
+def _format_seconds(ms) -> str:
+    # Envoy wants durations as strings like "3.000s". Most routes share a
+    # handful of timeout values, so memoize the formatting too.
+    return f"{ms / 1000.0:.3f}s"
+
+
+@lru_cache(maxsize=8192)
+def _compile_hostglob(glob: str):
+    # Parse a hostglob into (matcher, payload) once, rather than re-inspecting
+    # the glob on every match. The matchers are unbound str methods, so the
+    # actual comparison stays down in C. None means "matches everything".
     if glob == "*": # special wildcard
-        return True
+        return None
     elif glob.endswith("*"): # prefix match
-        if value.startswith(glob[:-1]):
-            return True
+        return (str.startswith, glob[:-1])
     elif glob.startswith("*"): # suffix match
-        if value.endswith(glob[1:]):
-            return True
+        return (str.endswith, glob[1:])
     else: # exact match
-        return value == glob
+        return (str.__eq__, glob)
+
+
+def hostglob_matches(glob: str, value: str) -> bool:
+    compiled = _compile_hostglob(glob)
+
+    if compiled is None:
+        return True
+
+    matcher, payload = compiled
+    return bool(matcher(value, payload))
 
 
 class V2Route(Cacheable):
+    # The route cache can hold a _lot_ of these, so don't pay for a
+    # per-instance __dict__ (the dict payload itself is the storage that
+    # matters; these slots are just bookkeeping).
+    __slots__ = ('_sni_hosts', '_authority_exact', '_host_constraints_cache')
+
+    # Precomputed in __init__ so that host_constraints doesn't have to rescan
+    # the route every time it's called.
+    _sni_hosts: FrozenSet[str]
+    _authority_exact: Optional[str]
+    _host_constraints_cache: Dict[bool, Set[str]]
+
     def __init__(self, config: 'V2Config', group: IRHTTPMappingGroup, mapping: IRBaseMapping) -> None:
         super().__init__()
 
+        # IRHTTPMappingGroup and IRBaseMapping are dict subclasses whose .get
+        # is a Python-level call; with a couple dozen accesses per route that
+        # adds up in big configs. Bind the methods once and use the locals.
+        gget = group.get
+        mget = mapping.get
+
+        # Everything that's invariant across the group's mappings has already
+        # been computed (once) in the group template; pull it from there rather
+        # than redoing the work for every mapping.
+        template = self._group_template(config, group)
+        tget = template.get
+
         # Stash SNI and precedence info where we can find it later.
-        if group.get('sni'):
-            self['_sni'] = {
-                'hosts': group['tls_context']['hosts'],
-                'secret_info': group['tls_context']['secret_info']
-            }
+        sni = tget('_sni')
+        if sni is not None:
+            self['_sni'] = sni
 
-        if group.get('precedence'):
-            self['_precedence'] = group['precedence']
+        precedence = tget('_precedence')
+        if precedence is not None:
+            self['_precedence'] = precedence
+
+        envoy_route = template['_envoy_route']
 
-        envoy_route = EnvoyRoute(group).envoy_route
+        mapping_prefix = mget('prefix', None)
+        route_prefix = mapping_prefix if mapping_prefix is not None else gget('prefix')
 
-        mapping_prefix = mapping.get('prefix', None)
-        route_prefix = mapping_prefix if mapping_prefix is not None else group.get('prefix')
+        mapping_case_sensitive = mget('case_sensitive', None)
+        case_sensitive = mapping_case_sensitive if mapping_case_sensitive is not None else gget('case_sensitive', True)
 
-        mapping_case_sensitive = mapping.get('case_sensitive', None)
-        case_sensitive = mapping_case_sensitive if mapping_case_sensitive is not None else group.get('case_sensitive', True)
+        weight = mget('weight', 100)
 
         runtime_fraction: Dict[str, Union[dict, str]] = {
-            'default_value': {
-                'numerator': mapping.get('weight', 100),
-                'denominator': 'HUNDRED'
+            'default_value': _WEIGHT_100_DEFAULT if weight == 100 else {
+                'numerator': weight,
+                'denominator': _DENOM_HUNDRED
             }
         }
 
@@ -113,86 +206,80 @@ class V2Route(Cacheable):
             # Cheat.
             if config.ir.edge_stack_allowed and (self.get('_precedence', 0) == -1000000):
                 # Force the safe_regex engine.
-                match.update({
-                    "safe_regex": {
-                        "google_re2": {
-                            "max_program_size": 200,
-                        },
-                        "regex": route_prefix
-                    }
-                })
+                match['safe_regex'] = {
+                    "google_re2": {
+                        "max_program_size": 200,
+                    },
+                    "regex": route_prefix
+                }
             else:
-                match.update(regex_matcher(config, route_prefix))
+                # regex_matcher returns a single-key dict; unpack it rather than
+                # allocating-and-copying through dict.update.
+                (mkey, mvalue), = regex_matcher(config, route_prefix).items()
+                match[mkey] = mvalue
 
-        headers = self.generate_headers(config, group)
-        if len(headers) > 0:
+        headers = tget('headers')
+        if headers:
             match['headers'] = headers
 
-        query_parameters = self.generate_query_parameters(config, group)
-        if len(query_parameters) > 0:
+        query_parameters = tget('query_parameters')
+        if query_parameters:
             match['query_parameters'] = query_parameters
 
         self['match'] = match
 
+        # Stash what host_constraints will want later.
+        self._sni_hosts = template['_sni_hosts']
+        self._authority_exact = tget('_authority_exact')
+        self._host_constraints_cache = {}
+
         # `per_filter_config` is used for customization of an Envoy filter
         per_filter_config = {}
 
-        if mapping.get('bypass_auth', False):
-            per_filter_config['envoy.ext_authz'] = {'disabled': True}
+        if mget('bypass_auth', False):
+            per_filter_config[_FILTER_EXT_AUTHZ] = {'disabled': True}
 
         if per_filter_config:
             self['per_filter_config'] = per_filter_config
 
-        request_headers_to_add = group.get('add_request_headers', None)
+        request_headers_to_add = tget('request_headers_to_add')
         if request_headers_to_add:
-            self['request_headers_to_add'] = self.generate_headers_to_add(request_headers_to_add)
+            self['request_headers_to_add'] = request_headers_to_add
 
-        response_headers_to_add = group.get('add_response_headers', None)
+        response_headers_to_add = tget('response_headers_to_add')
         if response_headers_to_add:
-            self['response_headers_to_add'] = self.generate_headers_to_add(response_headers_to_add)
+            self['response_headers_to_add'] = response_headers_to_add
 
-        request_headers_to_remove = group.get('remove_request_headers', None)
+        request_headers_to_remove = tget('request_headers_to_remove')
         if request_headers_to_remove:
-            if type(request_headers_to_remove) != list:
-                request_headers_to_remove = [ request_headers_to_remove ]
             self['request_headers_to_remove'] = request_headers_to_remove
 
-        response_headers_to_remove = group.get('remove_response_headers', None)
+        response_headers_to_remove = tget('response_headers_to_remove')
         if response_headers_to_remove:
-            if type(response_headers_to_remove) != list:
-                response_headers_to_remove = [ response_headers_to_remove ]
             self['response_headers_to_remove'] = response_headers_to_remove
 
-        host_redirect = group.get('host_redirect', None)
+        redirect = tget('redirect')
 
-        if host_redirect:
+        if redirect is not None:
             # We have a host_redirect. Deal with it.
-            self['redirect'] = {
-                'host_redirect': host_redirect.service
-            }
-
-            path_redirect = host_redirect.get('path_redirect', None)
-
-            if path_redirect:
-                self['redirect']['path_redirect'] = path_redirect
-
+            self['redirect'] = redirect
             return
 
         route = {
-            'priority': group.get('priority'),
-            'timeout': "%0.3fs" % (mapping.get('timeout_ms', 3000) / 1000.0),
+            'priority': gget('priority'),
+            'timeout': _format_seconds(mget('timeout_ms', 3000)),
             'cluster': mapping.cluster.envoy_name
         }
 
-        idle_timeout_ms = mapping.get('idle_timeout_ms', None)
+        idle_timeout_ms = mget('idle_timeout_ms', None)
 
         if idle_timeout_ms is not None:
-            route['idle_timeout'] = "%0.3fs" % (idle_timeout_ms / 1000.0)
+            route['idle_timeout'] = _format_seconds(idle_timeout_ms)
 
         regex_rewrite = self.generate_regex_rewrite(config, group)
         if len(regex_rewrite) > 0:
             route['regex_rewrite'] =  regex_rewrite
-        elif mapping.get('rewrite', None):
+        elif mget('rewrite', None):
             route['prefix_rewrite'] = mapping['rewrite']
 
         if 'host_rewrite' in mapping:
@@ -205,57 +292,178 @@ class V2Route(Cacheable):
         if len(hash_policy) > 0:
             route['hash_policy'] = [ hash_policy ]
 
-        cors = None
+        # CORS, the retry policy, and the shadow policy are all group-level;
+        # the template has already dup'd/serialized each of them once.
+        cors = tget('cors')
+        if cors:
+            route['cors'] = cors
 
-        if "cors" in group:
-            cors = group.cors
-        elif "cors" in config.ir.ambassador_module:
-            cors = config.ir.ambassador_module.cors
+        retry_policy = tget('retry_policy')
+        if retry_policy:
+            route['retry_policy'] = retry_policy
 
-        if cors:
-            # Duplicate this IRCORS, then set its group ID correctly.
-            cors = cors.dup()
-            cors.set_id(group.group_id)
+        # Is shadowing enabled?
+        request_mirror_policy = tget('request_mirror_policy')
+        if request_mirror_policy:
+            route['request_mirror_policy'] = request_mirror_policy
 
-            route['cors'] = cors.as_dict()
+        # Is RateLimit a thing? (The actions are built from group-level labels,
+        # so the template has already done the heavy lifting once per group.)
+        rate_limits = tget('rate_limits')
 
-        retry_policy = None
+        if rate_limits:
+            route["rate_limits"] = rate_limits
 
-        if "retry_policy" in group:
-            retry_policy = group.retry_policy.as_dict()
-        elif "retry_policy" in config.ir.ambassador_module:
-            retry_policy = config.ir.ambassador_module.retry_policy.as_dict()
+        # Save upgrade configs.
+        allow_upgrade = gget('allow_upgrade')
 
-        if retry_policy:
-            route['retry_policy'] = retry_policy
+        if allow_upgrade:
+            route["upgrade_configs"] = [ { 'upgrade_type': proto } for proto in allow_upgrade ]
 
-        # Is shadowing enabled?
-        shadow = group.get("shadows", None)
+        self['route'] = route
 
-        if shadow:
-            shadow = shadow[0]
 
-            weight = shadow.get('weight', 100)
+    @classmethod
+    def _group_template(cls, config: 'V2Config', group: IRHTTPMappingGroup) -> Dict[str, Any]:
+        """Return the parts of a route that depend only on the group, not on
+        any particular mapping within it.
+
+        A group with N mappings produces N routes, but fields like the SNI
+        info, header/query-parameter matchers, and header add/remove lists are
+        identical for all N. Build them once per group and let __init__ share
+        the result across its siblings (nobody downstream mutates them, they
+        just get serialized).
+        """
 
-            route['request_mirror_policy'] = {
-                'cluster': shadow.cluster.envoy_name,
-                'runtime_fraction': {
-                    'default_value': {
-                        'numerator': weight,
-                        'denominator': 'HUNDRED'
-                    }
-                }
+        templates = getattr(config, '_v2route_group_templates', None)
+
+        if templates is None:
+            templates = config._v2route_group_templates = {}
+
+        template = templates.get(group.group_id)
+
+        if template is not None:
+            return template
+
+        template = {}
+
+        if group.get('sni'):
+            template['_sni'] = {
+                'hosts': group['tls_context']['hosts'],
+                'secret_info': group['tls_context']['secret_info']
+            }
+            template['_sni_hosts'] = frozenset(group['tls_context']['hosts'])
+        else:
+            template['_sni_hosts'] = frozenset([ '*' ])
+
+        if group.get('precedence'):
+            template['_precedence'] = group['precedence']
+
+        template['_envoy_route'] = EnvoyRoute(group).envoy_route
+
+        headers = cls.generate_headers(config, group)
+        if len(headers) > 0:
+            template['headers'] = headers
+
+            # Note any :authority exact-match now, so host_constraints never
+            # has to rescan the headers for it.
+            for header in headers:
+                if header.get('name') == ':authority' and 'exact_match' in header:
+                    template['_authority_exact'] = header['exact_match']
+                    break
+
+        query_parameters = cls.generate_query_parameters(config, group)
+        if len(query_parameters) > 0:
+            template['query_parameters'] = query_parameters
+
+        request_headers_to_add = group.get('add_request_headers', None)
+        if request_headers_to_add:
+            template['request_headers_to_add'] = cls.generate_headers_to_add(request_headers_to_add)
+
+        response_headers_to_add = group.get('add_response_headers', None)
+        if response_headers_to_add:
+            template['response_headers_to_add'] = cls.generate_headers_to_add(response_headers_to_add)
+
+        request_headers_to_remove = group.get('remove_request_headers', None)
+        if request_headers_to_remove:
+            if not isinstance(request_headers_to_remove, list):
+                request_headers_to_remove = [ request_headers_to_remove ]
+            template['request_headers_to_remove'] = request_headers_to_remove
+
+        response_headers_to_remove = group.get('remove_response_headers', None)
+        if response_headers_to_remove:
+            if not isinstance(response_headers_to_remove, list):
+                response_headers_to_remove = [ response_headers_to_remove ]
+            template['response_headers_to_remove'] = response_headers_to_remove
+
+        host_redirect = group.get('host_redirect', None)
+
+        if host_redirect:
+            redirect = {
+                'host_redirect': host_redirect.service
             }
 
-        # Is RateLimit a thing?
-        rlsvc = config.ir.ratelimit
+            path_redirect = host_redirect.get('path_redirect', None)
+
+            if path_redirect:
+                redirect['path_redirect'] = path_redirect
+
+            template['redirect'] = redirect
+        else:
+            # Everything from here down only matters for groups that actually
+            # route: __init__ returns at the redirect before reading any of
+            # it, so don't do the work (or, for rate limits, surface label
+            # validation errors the redirect path has never produced).
+            cors = None
+
+            if "cors" in group:
+                cors = group.cors
+            elif "cors" in config.ir.ambassador_module:
+                cors = config.ir.ambassador_module.cors
+
+            if cors:
+                # Duplicate this IRCORS, then set its group ID correctly.
+                cors = cors.dup()
+                cors.set_id(group.group_id)
+
+                template['cors'] = cors.as_dict()
+
+            retry_policy = None
 
-        if rlsvc:
-            # Yup. Build our labels into a set of RateLimitActions (remember that default
-            # labels have already been handled, as has translating from v0 'rate_limits' to
-            # v1 'labels').
+            if "retry_policy" in group:
+                retry_policy = group.retry_policy.as_dict()
+            elif "retry_policy" in config.ir.ambassador_module:
+                retry_policy = config.ir.ambassador_module.retry_policy.as_dict()
 
-            if "labels" in group:
+            if retry_policy:
+                template['retry_policy'] = retry_policy
+
+            # Is shadowing enabled?
+            shadow = group.get("shadows", None)
+
+            if shadow:
+                shadow = shadow[0]
+
+                weight = shadow.get('weight', 100)
+
+                template['request_mirror_policy'] = {
+                    'cluster': shadow.cluster.envoy_name,
+                    'runtime_fraction': {
+                        'default_value': _WEIGHT_100_DEFAULT if weight == 100 else {
+                            'numerator': weight,
+                            'denominator': _DENOM_HUNDRED
+                        }
+                    }
+                }
+
+            # Is RateLimit a thing?
+            rlsvc = config.ir.ratelimit
+
+            if rlsvc and ("labels" in group):
+                # Yup. Build our labels into a set of RateLimitActions (remember that default
+                # labels have already been handled, as has translating from v0 'rate_limits' to
+                # v1 'labels').
+                #
                 # The Envoy RateLimit filter only supports one domain, so grab the configured domain
                 # from the RateLimitService and use that to look up the labels we should use.
 
@@ -268,14 +476,11 @@ class V2Route(Cacheable):
                         rate_limits.append(action.to_dict())
 
                 if rate_limits:
-                    route["rate_limits"] = rate_limits
+                    template['rate_limits'] = rate_limits
 
-        # Save upgrade configs.
-        if group.get('allow_upgrade'):
-            route["upgrade_configs"] = [ { 'upgrade_type': proto } for proto in group.get('allow_upgrade', []) ]
-
-        self['route'] = route
+        templates[group.group_id] = template
 
+        return template
 
     def host_constraints(self, prune_unreachable_routes: bool) -> Set[str]:
         """Return a set of hostglobs that match (a superset of) all
@@ -291,25 +496,40 @@ class V2Route(Cacheable):
         `:authority`), leading to it possibly returning a set that is
         too broad.  That's OK for correctness, it just means that
         we'll emit an Envoy config that contains extra work for Envoy.
+
+        Routes are immutable once built, so the answer is memoized the
+        first time each variant is asked for; callers must not mutate
+        the returned set.
         """
-        ret = set(self.get('_sni', {}).get('hosts', ['*']))
+        cache = self._host_constraints_cache
+        ret = cache.get(prune_unreachable_routes)
+
+        if ret is not None:
+            return ret
+
+        ret = set(self._sni_hosts)
 
         if prune_unreachable_routes:
-            match = self.get("match", {})
-            match_headers = match.get("headers", [])
-            for header in match_headers:
-                if header.get("name") == ":authority" and "exact_match" in header:
-                    if any(hostglob_matches(glob, header["exact_match"]) for glob in ret):
-                        return set([header["exact_match"]])
-                    else:
-                        return set()
+            authority = self._authority_exact
+
+            if authority is not None:
+                for glob in self._sni_hosts:
+                    compiled = _compile_hostglob(glob)
 
+                    if (compiled is None) or compiled[0](authority, compiled[1]):
+                        ret = set([authority])
+                        break
+                else:
+                    ret = set()
+
+        cache[prune_unreachable_routes] = ret
         return ret
 
 
     @classmethod
     def get_route(cls, config: 'V2Config', cache_key: str,
-                  irgroup: IRHTTPMappingGroup, mapping: IRBaseMapping) -> 'V2Route':
+                  irgroup: IRHTTPMappingGroup, mapping: IRBaseMapping,
+                  misses: Optional[List['V2Route']]=None) -> 'V2Route':
         route: 'V2Route'
 
         cached_route = config.cache[cache_key]
@@ -317,14 +537,20 @@ class V2Route(Cacheable):
         if cached_route is None:
             # Cache miss.
             # config.ir.logger.info(f"V2Route: cache miss for {cache_key}, synthesizing route")
-            
+
             route = V2Route(config, irgroup, mapping)
 
             # Cheat a bit and force the route's cache_key.
             route.cache_key = cache_key
 
             config.cache.add(route)
-            config.cache.link(irgroup, route)
+
+            # If the caller is collecting misses to link in a batch, let it;
+            # otherwise link to the group right away.
+            if misses is not None:
+                misses.append(route)
+            else:
+                config.cache.link(irgroup, route)
         else:
             # Cache hit. We know a priori that it's a V2Route, but let's assert that
             # before casting.
@@ -340,83 +566,103 @@ class V2Route(Cacheable):
     def generate(cls, config: 'V2Config') -> None:
         config.routes = []
 
-        for irgroup in config.ir.ordered_groups():
-            if not isinstance(irgroup, IRHTTPMappingGroup):
-                # We only want HTTP mapping groups here.
-                continue
+        # The regex engine settings are invariant for the whole generation;
+        # look them up once here instead of once per regex_matcher call.
+        config._regex_type = config.ir.ambassador_module.get('regex_type', 'safe').lower()
+        config._regex_max_size = int(config.ir.ambassador_module.get('regex_max_size', 200))
+
+        # We only want HTTP mapping groups here; filter them once, up front,
+        # rather than testing every group inside the loop. Bind the methods
+        # the loop hammers on to locals while we're at it.
+        http_groups = [ irgroup for irgroup in config.ir.ordered_groups()
+                        if isinstance(irgroup, IRHTTPMappingGroup) ]
+
+        save_element = config.save_element
+        routes_extend = config.routes.extend
+        get_route = cls.get_route
+        link_all = config.cache.link_all
+
+        for irgroup in http_groups:
+            # All of this group's cache keys share the same prefix; format it
+            # once and build the per-mapping keys by concatenation instead of
+            # re-running the f-string machinery for every mapping.
+            key_prefix = f"Route-{irgroup.group_id}-"
+
+            # Collect this group's routes in a batch, and its cache misses
+            # likewise, so we touch config.routes (and the cache's link set)
+            # once per group rather than once per mapping.
+            group_routes: List[V2Route] = []
+            group_routes_append = group_routes.append
+            misses: List[V2Route] = []
 
             if irgroup.get('host_redirect') is not None and len(irgroup.get('mappings', [])) == 0:
-                # This is a host-redirect-only group, which is weird, but can happen. Do we 
+                # This is a host-redirect-only group, which is weird, but can happen. Do we
                 # have a cached route for it?
-                key = f"Route-{irgroup.group_id}-hostredirect"
+                key = key_prefix + "hostredirect"
 
-                # Casting an empty dict to an IRBaseMapping may look weird, but in fact IRBaseMapping
-                # is (ultimately) a subclass of dict, so it's the cleanest way to pass in a completely
-                # empty IRBaseMapping to V2Route().
-                #
-                # (We could also have written V2Route to allow the mapping to be Optional, but that
-                # makes a lot of its constructor much uglier.)
-                route = config.save_element('route', irgroup, cls.get_route(config, key, irgroup, typecast(IRBaseMapping, {})))
-                config.routes.append(route)
+                route = save_element('route', irgroup, get_route(config, key, irgroup, _EMPTY_MAPPING, misses))
+                group_routes_append(route)
 
             # Repeat for our real mappings.
             for mapping in irgroup.mappings:
-                key = f"Route-{irgroup.group_id}-{mapping.cache_key}"
-
-                route = config.save_element('route', irgroup, cls.get_route(config, key, irgroup, mapping))
-                config.routes.append(route)
-
-    @staticmethod
-    def generate_headers(config: 'V2Config', mapping_group: IRHTTPMappingGroup) -> List[dict]:
-        headers = []
-
-        group_headers = mapping_group.get('headers', [])
+                key = key_prefix + mapping.cache_key
 
-        for group_header in group_headers:
-            header = { 'name': group_header.get('name') }
+                route = save_element('route', irgroup, get_route(config, key, irgroup, mapping, misses))
+                group_routes_append(route)
 
-            if group_header.get('regex'):
-                header.update(regex_matcher(config, group_header.get('value'), key='regex_match'))
-            else:
-                header['exact_match'] = group_header.get('value')
+            if misses:
+                link_all(irgroup, misses)
 
-            headers.append(header)
-
-        return headers
+            routes_extend(group_routes)
 
     @staticmethod
-    def generate_query_parameters(config: 'V2Config', mapping_group: IRHTTPMappingGroup) -> List[dict]:
-        query_parameters = []
-
-        group_query_parameters = mapping_group.get('query_parameters', [])
-
-        for group_query_parameter in group_query_parameters:
-            query_parameter = { 'name': group_query_parameter.get('name') }
-
-            if group_query_parameter.get('regex'):
-                query_parameter.update({
-                    'string_match': regex_matcher(
-                        config,
-                        group_query_parameter.get('value'),
-                        key='regex'
-                    )
-                })
-            else:
-                value = group_query_parameter.get('value', None)
+    def _generate_matchers(config: 'V2Config', items: List[dict],
+                           regex_key: str, wrap_string_match: bool=False) -> List[dict]:
+        # Header matchers and query-parameter matchers share the same
+        # skeleton: one entry per item, matching either a regex or an exact
+        # value. The differences are the key the regex goes under and how an
+        # exact value is spelled -- headers use a bare 'exact_match', query
+        # parameters wrap everything in 'string_match' and fall back to
+        # 'present_match' when there's no value at all. Do it all in one
+        # pass with the method lookups bound outside the loop.
+        matchers = []
+        append = matchers.append
+
+        for item in items:
+            iget = item.get
+
+            matcher = { 'name': iget('name') }
+            value = iget('value')
+
+            if iget('regex'):
+                regex = regex_matcher(config, value, key=regex_key)
+
+                if wrap_string_match:
+                    matcher['string_match'] = regex
+                else:
+                    (mkey, mvalue), = regex.items()
+                    matcher[mkey] = mvalue
+            elif wrap_string_match:
                 if value is not None:
-                    query_parameter.update({
-                        'string_match': {
-                            'exact': group_query_parameter.get('value')
-                        }
-                    })
+                    matcher['string_match'] = { 'exact': value }
                 else:
-                    query_parameter.update({
-                        'present_match': True
-                    })
+                    matcher['present_match'] = True
+            else:
+                matcher['exact_match'] = value
 
-            query_parameters.append(query_parameter)
+            append(matcher)
 
-        return query_parameters
+        return matchers
+
+    @classmethod
+    def generate_headers(cls, config: 'V2Config', mapping_group: IRHTTPMappingGroup) -> List[dict]:
+        return cls._generate_matchers(config, mapping_group.get('headers', []),
+                                      regex_key='regex_match')
+
+    @classmethod
+    def generate_query_parameters(cls, config: 'V2Config', mapping_group: IRHTTPMappingGroup) -> List[dict]:
+        return cls._generate_matchers(config, mapping_group.get('query_parameters', []),
+                                      regex_key='regex', wrap_string_match=True)
 
     @staticmethod
     def generate_hash_policy(mapping_group: IRHTTPMappingGroup) -> dict:
@@ -450,28 +696,17 @@ class V2Route(Cacheable):
 
     @staticmethod
     def generate_headers_to_add(header_dict: dict) -> List[dict]:
-        headers = []
-        for k, v in header_dict.items():
-                append = True
-                if isinstance(v,dict):
-                    if 'append' in v:
-                        append = bool(v['append'])
-                    headers.append({
-                        'header': {
-                            'key': k,
-                            'value': v['value']
-                        },
-                        'append': append
-                    })
-                else:
-                    headers.append({
-                        'header': {
-                            'key': k,
-                            'value': v
-                        },
-                        'append': append  # Default append True, for backward compatability
-                    })
-        return headers
+        # Default append True, for backward compatability.
+        return [
+            {
+                'header': {
+                    'key': k,
+                    'value': v['value'] if isinstance(v, dict) else v
+                },
+                'append': bool(v['append']) if (isinstance(v, dict) and ('append' in v)) else True
+            }
+            for k, v in header_dict.items()
+        ]
 
     @staticmethod
     def generate_regex_rewrite(config: 'V2Config', mapping_group: IRHTTPMappingGroup) -> dict:
@@ -480,7 +715,8 @@ class V2Route(Cacheable):
         if group_regex_rewrite is not None:
             pattern = group_regex_rewrite.get('pattern', None)            
             if (pattern is not None):
-                regex_rewrite.update(regex_matcher(config, pattern, key='regex',safe_key='pattern', re_type='safe')) # regex_rewrite should never ever be unsafe
+                (mkey, mvalue), = regex_matcher(config, pattern, key='regex',safe_key='pattern', re_type='safe').items() # regex_rewrite should never ever be unsafe
+                regex_rewrite[mkey] = mvalue
         substitution = group_regex_rewrite.get('substitution', None)
         if (substitution is not None):
             regex_rewrite["substitution"] = substitution